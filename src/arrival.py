@@ -1,25 +1,40 @@
 # src/arrival.py
 import simpy
-import random
+import numpy as np
 from patient import Patient
+from router import patient_flow
 
-def arrival_generator(env: simpy.Environment, arrival_rate: float, registration_node, metrics, max_arrivals: int = None):
+# number of inter-arrival times drawn per call to rng.exponential
+INTERARRIVAL_BUFFER_SIZE = 8192
+
+def arrival_generator(env: simpy.Environment, arrival_rate: float, nodes, p_lab: float, metrics,
+                      max_arrivals: int = None, rng: np.random.Generator = None):
     """
     Generate patients as a homogeneous Poisson process with rate arrival_rate.
-    For each patient, start the registration process (env.process(registration_node.serve(patient))).
+    For each patient, start its whole path as one process (env.process(patient_flow(...))).
     metrics.add_patient will collect patient object for later analysis.
+    Inter-arrival times are drawn in batches from rng (a numpy Generator), which is also passed
+    to every patient's flow for service times and routing; if omitted one is created here, once.
     """
+    if rng is None:
+        rng = np.random.default_rng()
     pid = 0
+    ias = []
+    i = 0
     while True:
         if arrival_rate <= 0:
             # no arrivals
             break
-        ia = random.expovariate(arrival_rate)
+        if i >= len(ias):
+            ias = rng.exponential(1.0 / arrival_rate, size=INTERARRIVAL_BUFFER_SIZE).tolist()
+            i = 0
+        ia = ias[i]
+        i += 1
         yield env.timeout(ia)
         pid += 1
         p = Patient(pid, env.now)
         metrics.add_patient(p)
-        # directly start registration serve process; after registration, patient flow continues in registration's logic
-        env.process(registration_node.serve(p))
+        # one process per patient covering registration through pharmacy
+        env.process(patient_flow(env, p, nodes, p_lab, rng, metrics))
         if max_arrivals is not None and pid >= max_arrivals:
             break
@@ -13,6 +13,11 @@ config = {
         'lab':          {'service_rate': 10.0, 'servers': 4},
         'pharmacy':     {'service_rate': 6.0, 'servers': 2}
     },
+    # simulation engine: 'simpy' (queue_node/router model), 'core' (compiled sim_core loop),
+    # or 'auto' = 'core' when numba is installed, else 'simpy'.
+    # The engines use different RNGs, so the same seed only reproduces within one engine;
+    # the default is the SimPy model so results do not depend on whether numba is installed.
+    'engine': 'simpy',
     # default experiment meta (used by experiments.py if desired)
     'default_run_time': 20000.0,
     'default_warmup_time': 2000.0,
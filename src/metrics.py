@@ -2,7 +2,26 @@
 import csv
 import math
 from typing import Dict, List
-import statistics
+import numpy as np
+from patient import FIELD
+
+# write buffer for CSV output files (bytes)
+CSV_BUFFERING = 1 << 20
+
+PER_PATIENT_HEADER = [
+    'workload', 'rep', 'seed', 'patient_id', 'arrival_time',
+    'reg_arrival', 'reg_service_start', 'reg_service_end',
+    'doc_arrival', 'doc_service_start', 'doc_service_end',
+    'lab_arrival', 'lab_service_start', 'lab_service_end',
+    'phar_arrival', 'phar_service_start', 'phar_service_end',
+    'exit_time'
+]
+
+PER_NODE_HEADER = [
+    'workload', 'rep', 'seed', 'node_name', 'servers', 'mu', 'lambda_effective',
+    'E[w]', 'E[s]', 'E[r]',
+    'E[n_q]', 'E[n_s]', 'E[n]', 'utilization', 'num_completed_jobs'
+]
 
 class Metrics:
     def __init__(self, nodes: Dict[str, object], warmup_time: float, run_time: float, output_dir: str = "outputs/results_csv"):
@@ -17,48 +36,67 @@ class Metrics:
         self.effective_time = max(0.0, run_time)  # we will assume nodes.finalize called with warmup+run_time
         self.patients = []  # store Patient objects (all created)
         self.output_dir = output_dir
+        # filtered list of post-warmup patients, built lazily once the simulation has ended
+        self._post_warmup_cache = None
+        # (arrival, service_start) Patient attribute names per node, resolved once
+        self._wait_fields = tuple(FIELD[node][:2] for node in ['registration', 'doctor', 'lab', 'pharmacy'])
+        # overall E[w] / E[R] accumulated online as post-warmup patients leave the system
+        self.n_arrived = 0  # post-warmup arrivals
+        self.n_done = 0     # post-warmup patients that finished pharmacy
+        self.sum_w = 0.0
+        self.sum_r = 0.0
 
     def add_patient(self, patient):
         self.patients.append(patient)
+        if patient.arrival_time >= self.warmup_time:
+            self.n_arrived += 1
+
+    def record_exit(self, patient):
+        """
+        Called when a patient leaves the system (end of pharmacy service).
+        Adds its total wait over visited nodes and its response time to the running sums.
+        """
+        if patient.arrival_time < self.warmup_time:
+            return
+        total = 0.0
+        for a_attr, s_attr in self._wait_fields:
+            a = getattr(patient, a_attr)
+            s = getattr(patient, s_attr)
+            if a is not None and s is not None:
+                total += s - a
+        self.sum_w += total
+        self.sum_r += patient.phar_e - patient.arrival_time
+        self.n_done += 1
 
     def _patients_after_warmup(self):
         # include patients whose registration arrival >= warmup_time
-        return [p for p in self.patients if (p.get('registration_arrival') is not None and p.get('registration_arrival') >= self.warmup_time)]
+        # memoized: only called after env.run() finishes, so self.patients no longer changes
+        if self._post_warmup_cache is None:
+            cache = []
+            for p in self.patients:
+                t = p.reg_a
+                if t is not None and t >= self.warmup_time:
+                    cache.append(p)
+            self._post_warmup_cache = cache
+        return self._post_warmup_cache
 
     def finalize_nodes(self, sim_end_time: float):
         # call finalize on nodes so they accumulate areas up to sim_end_time
         for node in self.nodes.values():
-            try:
-                node.finalize(sim_end_time)
-            except Exception:
-                pass
+            node.finalize(sim_end_time)
 
     def compute_node_metrics(self):
         """
-        Compute per-node metrics: mean_wait, mean_service, mean_response (per-node),
+        Compute per-node metrics: mean_wait, mean_service, mean_response (per-node, post-warmup patients),
         avg_queue_length, avg_in_service, utilization, num_completed_jobs
         """
         node_stats = {}
         effective_T = self.effective_time if self.effective_time > 0 else 1.0
         for name, node in self.nodes.items():
-            # compute average waiting time and service time based on patients who visited
-            waits = []
-            services = []
-            responses = []
-            for p in self._patients_after_warmup():
-                # waiting at node = service_start - arrival at node
-                a = p.get(f"{name}_arrival")
-                s = p.get(f"{name}_service_start")
-                e = p.get(f"{name}_service_end")
-                if a is not None and s is not None:
-                    waits.append(max(0.0, s - a))
-                if s is not None and e is not None:
-                    services.append(max(0.0, e - s))
-                if a is not None and e is not None:
-                    responses.append(max(0.0, e - a))
-            mean_wait = statistics.mean(waits) if waits else 0.0
-            mean_service = statistics.mean(services) if services else 0.0
-            mean_response = statistics.mean(responses) if responses else 0.0
+            # wait/service/response means are accumulated online by the node during serve()
+            mean_wait = node.mean_wait()
+            mean_service = node.mean_service()
+            mean_response = node.mean_response()
 
             avg_q = node.avg_queue_length(effective_T)
             avg_in_service = node.avg_in_service(effective_T)
@@ -97,63 +135,39 @@ class Metrics:
     #     return {'E[w]': Ew, 'E[R]': Er, 'num_patients': len(self._patients_after_warmup())}
     
     def compute_overall_metrics(self):
-        # E[w], E[R] overall (across nodes/patients)
-        waits = []
-        responses = []
-        for p in self._patients_after_warmup():
-            # accumulate waiting times across nodes visited
-            total = 0
-            for node in ['registration', 'doctor', 'lab', 'pharmacy']:
-                a = p.get(f"{node}_arrival")
-                s = p.get(f"{node}_service_start")
-                if a is not None and s is not None:
-                    total+= s-a
-            waits.append(total)
-            # response total: patient.exit_time() - arrival_time (if exit exists)
-            exit_t = p.exit_time()
-            if exit_t is not None:
-                responses.append(max(0.0, exit_t - p.arrival_time))
-        Ew = statistics.mean(waits) if waits else 0.0
-        Er = statistics.mean(responses) if responses else 0.0
-        return {'E[w]': Ew, 'E[R]': Er, 'num_patients': len(self._patients_after_warmup())}
+        # E[w], E[R] overall: means over post-warmup patients that left the system (see record_exit)
+        Ew = self.sum_w / self.n_done if self.n_done else 0.0
+        Er = self.sum_r / self.n_done if self.n_done else 0.0
+        return {'E[w]': Ew, 'E[R]': Er, 'num_patients': self.n_arrived}
 
     def write_per_patient_csv(self, filepath: str, workload: str, rep: int, seed: int):
-        header = [
-            'workload', 'rep', 'seed', 'patient_id', 'arrival_time',
-            'reg_arrival', 'reg_service_start', 'reg_service_end',
-            'doc_arrival', 'doc_service_start', 'doc_service_end',
-            'lab_arrival', 'lab_service_start', 'lab_service_end',
-            'phar_arrival', 'phar_service_start', 'phar_service_end',
-            'exit_time'
-        ]
-        rows = []
-        for p in self._patients_after_warmup():
-            row = [
-                workload, rep, seed, p.id, p.arrival_time,
-                p.get('registration_arrival'), p.get('registration_service_start'), p.get('registration_service_end'),
-                p.get('doctor_arrival'), p.get('doctor_service_start'), p.get('doctor_service_end'),
-                p.get('lab_arrival'), p.get('lab_service_start'), p.get('lab_service_end'),
-                p.get('pharmacy_arrival'), p.get('pharmacy_service_start'), p.get('pharmacy_service_end'),
-                p.exit_time()
-            ]
-            rows.append(row)
+
+        def gen():
+            # stream rows straight into the writer instead of materializing them
+            for p in self._patients_after_warmup():
+                yield (
+                    workload, rep, seed, p.id, p.arrival_time,
+                    p.reg_a, p.reg_s, p.reg_e,
+                    p.doc_a, p.doc_s, p.doc_e,
+                    p.lab_a, p.lab_s, p.lab_e,
+                    p.phar_a, p.phar_s, p.phar_e,
+                    p.exit_time()
+                )
+
         # write csv
-        with open(filepath, 'w', newline='') as f:
+        with open(filepath, 'w', newline='', buffering=CSV_BUFFERING) as f:
             writer = csv.writer(f)
-            writer.writerow(header)
-            writer.writerows(rows)
+            writer.writerow(PER_PATIENT_HEADER)
+            writer.writerows(gen())
 
-    def write_per_node_csv(self, filepath: str, workload: str, rep: int, seed: int):
+    def per_node_rows(self, workload: str, rep: int, seed: int):
+        """
+        Yield one PER_NODE_HEADER row per node for this replication.
+        """
         node_stats = self.compute_node_metrics()
-        header = [
-            'workload', 'rep', 'seed', 'node_name', 'servers', 'mu', 'lambda_effective',
-            'E[w]', 'E[s]', 'E[r]',
-            'E[n_q]', 'E[n_s]', 'E[n]', 'utilization', 'num_completed_jobs'
-        ]
-        rows = []
         # estimate lambda_effective using visit ratios: here we assume external lambda belongs to config usage (caller)
         for name, s in node_stats.items():
-            row = [
+            yield (
                 workload, rep, seed, name,
                 self.nodes[name].servers,
                 self.nodes[name].service_rate,
@@ -166,9 +180,57 @@ class Metrics:
                 s['avg_in_system'],
                 s['utilization'],
                 s['num_completed_jobs']
-            ]
-            rows.append(row)
-        with open(filepath, 'w', newline='') as f:
+            )
+
+    def write_per_node_csv_rows(self, writer, workload: str, rep: int, seed: int):
+        # append this replication's rows to an already-open csv.writer (header written by caller)
+        writer.writerows(self.per_node_rows(workload, rep, seed))
+
+    def write_per_node_csv(self, filepath: str, workload: str, rep: int, seed: int):
+        with open(filepath, 'w', newline='', buffering=CSV_BUFFERING) as f:
+            writer = csv.writer(f)
+            writer.writerow(PER_NODE_HEADER)
+            self.write_per_node_csv_rows(writer, workload, rep, seed)
+
+class ArrayMetrics(Metrics):
+    """
+    Metrics for one run of the compiled core (sim_core.simulate). Node counters arrive
+    already reduced in NodeStats objects; patient timestamps are NumPy columns
+    (times[node, arrival/start/end, patient], NaN if not reached) instead of Patient objects.
+    """
+    def __init__(self, nodes: Dict[str, object], warmup_time: float, run_time: float,
+                 arrival_times: np.ndarray, times: np.ndarray, output_dir: str = "outputs/results_csv"):
+        super().__init__(nodes, warmup_time, run_time, output_dir=output_dir)
+        self.arrival_times = arrival_times
+        self.times = times
+        self._mask = arrival_times >= warmup_time
+        # fill the overall sums that record_exit keeps for the SimPy model, vectorized
+        done = self._mask & ~np.isnan(times[3, 2])
+        # per-patient total wait over nodes with both timestamps (NaN terms count as 0)
+        waits = np.nansum(times[:, 1, done] - times[:, 0, done], axis=0)
+        self.n_arrived = int(self._mask.sum())
+        self.n_done = int(done.sum())
+        self.sum_w = float(waits.sum())
+        self.sum_r = float((times[3, 2, done] - arrival_times[done]).sum())
+
+    def finalize_nodes(self, sim_end_time: float):
+        # simulate() already closed the area integrals at warmup + run_time
+        pass
+
+    def write_per_patient_csv(self, filepath: str, workload: str, rep: int, seed: int):
+        idx = np.flatnonzero(self._mask)
+        # node-major columns -> one row per patient; NaN -> None so missing cells stay empty
+        cols = self.times[:, :, idx].reshape(12, idx.size).T.tolist()
+        arrival = self.arrival_times[idx].tolist()
+
+        def gen():
+            for i, t, row in zip(idx.tolist(), arrival, cols):
+                row = [None if v != v else v for v in row]
+                # exit: pharmacy end if present, else doctor end (as Patient.exit_time)
+                exit_t = row[11] if row[11] is not None else row[5]
+                yield [workload, rep, seed, i + 1, t] + row + [exit_t]
+
+        with open(filepath, 'w', newline='', buffering=CSV_BUFFERING) as f:
             writer = csv.writer(f)
-            writer.writerow(header)
-            writer.writerows(rows)
+            writer.writerow(PER_PATIENT_HEADER)
+            writer.writerows(gen())
@@ -1,29 +1,56 @@
 # src/patient.py
-from typing import Dict, Optional
+from typing import Optional
+
+# node name -> (arrival, service_start, service_end) attribute names on Patient
+FIELD = {
+    'registration': ('reg_a', 'reg_s', 'reg_e'),
+    'doctor':       ('doc_a', 'doc_s', 'doc_e'),
+    'lab':          ('lab_a', 'lab_s', 'lab_e'),
+    'pharmacy':     ('phar_a', 'phar_s', 'phar_e'),
+}
+
+# legacy "<node>_arrival" style keys -> attribute name, used by get()
+_KEY_ATTR = {}
+for _node, (_a, _s, _e) in FIELD.items():
+    _KEY_ATTR[f"{_node}_arrival"] = _a
+    _KEY_ATTR[f"{_node}_service_start"] = _s
+    _KEY_ATTR[f"{_node}_service_end"] = _e
 
 class Patient:
+    # fixed slots instead of a per-patient timestamps dict
+    __slots__ = ('id', 'arrival_time',
+                 'reg_a', 'reg_s', 'reg_e',
+                 'doc_a', 'doc_s', 'doc_e',
+                 'lab_a', 'lab_s', 'lab_e',
+                 'phar_a', 'phar_s', 'phar_e')
+
     def __init__(self, id: int, arrival_time: float):
         self.id = id
         self.arrival_time = arrival_time
-        # standardized timestamps: for each node X store:
-        # X_arrival (time patient entered node queue),
-        # X_service_start, X_service_end
-        self.timestamps: Dict[str, float] = {}
+        # standardized timestamps: for each node X store
+        # X arrival (time patient entered node queue), X service start, X service end
+        # None means the patient has not reached that point
+        self.reg_a = self.reg_s = self.reg_e = None
+        self.doc_a = self.doc_s = self.doc_e = None
+        self.lab_a = self.lab_s = self.lab_e = None
+        self.phar_a = self.phar_s = self.phar_e = None
 
     def record_arrival(self, node: str, t: float):
-        self.timestamps[f"{node}_arrival"] = t
+        setattr(self, FIELD[node][0], t)
 
     def record_service_start(self, node: str, t: float):
-        self.timestamps[f"{node}_service_start"] = t
+        setattr(self, FIELD[node][1], t)
 
     def record_service_end(self, node: str, t: float):
-        self.timestamps[f"{node}_service_end"] = t
+        setattr(self, FIELD[node][2], t)
 
     def get(self, key: str):
-        return self.timestamps.get(key, None)
+        # backwards-compatible lookup by "<node>_arrival" / "_service_start" / "_service_end"
+        attr = _KEY_ATTR.get(key)
+        return getattr(self, attr) if attr is not None else None
 
     def exit_time(self) -> Optional[float]:
         # Define exit as pharmacy_service_end if exists, else doctor_service_end, else None
-        if self.get('pharmacy_service_end') is not None:
-            return self.get('pharmacy_service_end')
-        return self.get('doctor_service_end')
+        if self.phar_e is not None:
+            return self.phar_e
+        return self.doc_e
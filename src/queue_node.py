@@ -1,83 +1,186 @@
 # src/queue_node.py
+import array
 import simpy
-import random
-from typing import Dict, List
+import numpy as np
+from collections import deque
+from typing import Deque, Dict, List
 
-class QueueNode:
-    def __init__(self, env: simpy.Environment, name: str, service_rate: float, servers: int):
-        self.env = env
+# number of service times drawn per refill of a node's sample buffer
+SERVICE_BUFFER_SIZE = 8192
+
+class NodeStats:
+    """
+    Per-node counters and the statistics derived from them. QueueNode fills them
+    while the SimPy model runs; the compiled core (sim_core) fills them from its arrays.
+    """
+    def __init__(self, name: str, service_rate: float, servers: int):
         self.name = name
         self.service_rate = float(service_rate)  # mu per server
         self.servers = int(servers)
-        self.resource = simpy.Resource(env, capacity=self.servers)
-        # area integrals and bookkeeping
-        self.last_event_time = 0.0
+        # area integrals
         self.queue_area = 0.0       # integral of queue_length(t) dt
         self.busy_area = 0.0        # integral of in_service(t) dt
-        self.current_in_service = 0 # number of servers busy at current time
         self.system_area= 0.0
-        # queue log (time, q_len) for optional post-checking
-        self.queue_log: List[tuple] = []  # list of (time, queue_length)
         # count completed jobs
         self.completed_jobs = 0
+        # online sums of per-patient wait/service/response (post-warmup patients only)
+        self.wait_sum = 0.0
+        self.wait_count = 0
+        self.service_sum = 0.0
+        self.service_count = 0
+        self.response_sum = 0.0
+        self.response_count = 0
+
+    def mean_wait(self) -> float:
+        return self.wait_sum / self.wait_count if self.wait_count else 0.0
+
+    def mean_service(self) -> float:
+        return self.service_sum / self.service_count if self.service_count else 0.0
+
+    def mean_response(self) -> float:
+        return self.response_sum / self.response_count if self.response_count else 0.0
+
+    def avg_queue_length(self, effective_time: float) -> float:
+        if effective_time <= 0:
+            return 0.0
+        return self.queue_area / effective_time
+
+    def avg_in_service(self, effective_time: float) -> float:
+        if effective_time <= 0:
+            return 0.0
+        return self.busy_area / effective_time
+    
+    def avg_in_system(self, effective_time: float) -> float:
+        if effective_time <= 0:
+            return 0.0
+        return self.system_area / effective_time
+
+    def utilization(self, effective_time: float) -> float:
+        denom = self.servers * effective_time
+        if denom <= 0:
+            return 0.0
+        return self.busy_area / denom
+
+class QueueNode(NodeStats):
+    def __init__(self, env: simpy.Environment, name: str, service_rate: float, servers: int, warmup_time: float = 0.0,
+                 keep_log: bool = False, rng: np.random.Generator = None):
+        super().__init__(name, service_rate, servers)
+        self.env = env
+        self.warmup_time = float(warmup_time)  # patients arriving before this are excluded from the sums
+        # FIFO of events for patients waiting for a server (replaces simpy.Resource)
+        self._waitq: Deque[simpy.Event] = deque()
+        self._q_len = 0  # == len(self._waitq), kept as a plain int for the area updates
+        # bookkeeping for the area integrals
+        self.last_event_time = 0.0
+        self.current_in_service = 0 # number of servers busy at current time
+        # queue log (time, q_len) for optional post-checking; only filled when keep_log is set
+        self.keep_log = keep_log
+        # stored as two parallel C arrays (time, queue_length) instead of a list of tuples
+        self.queue_log_t = array.array('d')
+        self.queue_log_q = array.array('i')
+        # pre-drawn exponential service times, consumed in order and refilled in batches
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self._rng_buf: List[float] = []
+        self._rng_i = 0
         # set last_event_time to env.now initially
         self.last_event_time = env.now
 
-    def _update_areas(self):
+    def _update_areas(self, delta_in_service: int = 0):
+        # integrate the interval since the last event using the state that held during it,
+        # then apply the change in number of busy servers
         now = self.env.now
         delta = now - self.last_event_time
         if delta < 0:
             delta = 0.0
-        # queue length is number waiting in resource.queue
-        q_len = len(self.resource.queue)
+        # queue length is number waiting for a server
+        q_len = self._q_len
         self.queue_area += q_len * delta
         self.busy_area += self.current_in_service * delta
         self.system_area += (q_len + self.current_in_service) * delta
+        self.current_in_service += delta_in_service
         self.last_event_time = now
         # optional log
-        self.queue_log.append((now, q_len))
+        if self.keep_log:
+            self.queue_log_t.append(now)
+            self.queue_log_q.append(q_len)
+
+    @property
+    def queue_log(self) -> List[tuple]:
+        # (time, queue_length) pairs, built on demand from the parallel arrays
+        return list(zip(self.queue_log_t, self.queue_log_q))
+
+    def _refill_service_buffer(self):
+        # tolist() so each draw is a plain float rather than a NumPy scalar
+        self._rng_buf = self.rng.exponential(1.0 / self.service_rate, size=SERVICE_BUFFER_SIZE).tolist()
+        self._rng_i = 0
 
     def _sample_service_time(self) -> float:
-        # Use Python's random.expovariate(lambda) where lambda = service_rate
+        # exponential with rate service_rate, taken from a batch pre-drawn by self.rng
         if self.service_rate <= 0:
             return 0.0
-        return random.expovariate(self.service_rate)
+        if self._rng_i >= len(self._rng_buf):
+            self._refill_service_buffer()
+        v = self._rng_buf[self._rng_i]
+        self._rng_i += 1
+        return v
 
     def serve(self, patient):
         """
         This is a generator to be used as env.process(node.serve(patient))
         It records patient arrival, service start, service end, and updates areas.
+        Areas are integrated twice per visit (queue entry and service end): a service
+        always starts at the same instant as one of those updates (this patient's
+        arrival, or another patient's release), so no time elapses to integrate there.
+        Servers are a plain counter plus a FIFO of waiting events: a finishing patient
+        hands its server directly to the head of the queue, so it is never seen as free.
         """
         # patient arrives to this node (enters queue)
-        patient.record_arrival(self.name, self.env.now)
+        arrival = self.env.now
+        counted = patient.arrival_time >= self.warmup_time
+        patient.record_arrival(self.name, arrival)
         # update areas up to now BEFORE changing counters
         self._update_areas()
 
-        with self.resource.request() as req:
-            yield req  # wait for a free server
-            # just before starting service
-            self._update_areas()
-            # service start
-            patient.record_service_start(self.name, self.env.now)
-            # update counters
+        if self.current_in_service < self.servers:
+            # free server: start immediately
             self.current_in_service += 1
-            # update areas after change
-            self._update_areas()
+        else:
+            # wait for a server to be handed over (counters already include it then)
+            ev = self.env.event()
+            self._waitq.append(ev)
+            self._q_len += 1
+            yield ev
+
+        # service start
+        start = self.env.now
+        patient.record_service_start(self.name, start)
+        if counted:
+            self.wait_sum += start - arrival
+            self.wait_count += 1
+
+        # actual service time
+        service_time = self._sample_service_time()
+        if service_time > 0:
+            yield self.env.timeout(service_time)
+        else:
+            yield self.env.timeout(0)
 
-            # actual service time
-            service_time = self._sample_service_time()
-            if service_time > 0:
-                yield self.env.timeout(service_time)
-            else:
-                yield self.env.timeout(0)
-
-            # service ends
-            patient.record_service_end(self.name, self.env.now)
-            # update counters
-            self.current_in_service -= 1
-            self.completed_jobs += 1
-            # update area after finishing
+        # service ends
+        end = self.env.now
+        patient.record_service_end(self.name, end)
+        if counted:
+            self.service_sum += end - start
+            self.service_count += 1
+            self.response_sum += end - arrival
+            self.response_count += 1
+        self.completed_jobs += 1
+        # integrate up to now with this server still busy, then hand it over or free it
+        if self._q_len:
             self._update_areas()
+            self._q_len -= 1
+            self._waitq.popleft().succeed()
+        else:
+            self._update_areas(-1)
 
     def finalize(self, sim_end_time: float):
         """
@@ -86,28 +189,8 @@ class QueueNode:
         now = self.env.now
         if sim_end_time > self.last_event_time:
             delta = sim_end_time - self.last_event_time
-            q_len = len(self.resource.queue)
+            q_len = self._q_len
             self.queue_area += q_len * delta
             self.busy_area += self.current_in_service * delta
+            self.system_area += (q_len + self.current_in_service) * delta
             self.last_event_time = sim_end_time
-
-    def avg_queue_length(self, effective_time: float) -> float:
-        if effective_time <= 0:
-            return 0.0
-        return self.queue_area / effective_time
-
-    def avg_in_service(self, effective_time: float) -> float:
-        if effective_time <= 0:
-            return 0.0
-        return self.busy_area / effective_time
-    
-    def avg_in_system(self, effective_time: float) -> float:
-        if effective_time <= 0:
-            return 0.0
-        return self.system_area / effective_time
-
-    def utilization(self, effective_time: float) -> float:
-        denom = self.servers * effective_time
-        if denom <= 0:
-            return 0.0
-        return self.busy_area / denom
@@ -1,14 +1,29 @@
 # src/router.py
-import random
+import numpy as np
 
-def route_after_doctor(env, patient, lab_node, pharmacy_node, p_lab: float):
+def route_after_doctor(env, patient, lab_node, pharmacy_node, p_lab: float, rng: np.random.Generator,
+                       metrics=None):
     """
     Route patient after finishing doctor node.
     This function is designed to be called inside a process context (i.e., yield from).
+    If metrics is given, metrics.record_exit(patient) is called once pharmacy is done.
+    The routing draw comes from rng, the replication's numpy Generator.
     """
     # decide to go lab or not
-    if random.random() < p_lab:
+    if rng.random() < p_lab:
         # go to lab first
-        yield env.process(lab_node.serve(patient))
+        yield from lab_node.serve(patient)
     # then always go to pharmacy
-    yield env.process(pharmacy_node.serve(patient))
+    yield from pharmacy_node.serve(patient)
+    if metrics is not None:
+        metrics.record_exit(patient)
+
+def patient_flow(env, patient, nodes, p_lab: float, rng: np.random.Generator, metrics=None):
+    """
+    Whole path of one patient: registration -> doctor -> [lab] -> pharmacy.
+    Run as a single process (env.process(patient_flow(...))); every stage is a yield from,
+    so no extra SimPy Process is created per node visit.
+    """
+    yield from nodes['registration'].serve(patient)
+    yield from nodes['doctor'].serve(patient)
+    yield from route_after_doctor(env, patient, nodes['lab'], nodes['pharmacy'], p_lab, rng, metrics)
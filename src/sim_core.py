@@ -0,0 +1,169 @@
+# src/sim_core.py
+# Compiled event loop for the fixed network registration -> doctor -> [lab] -> pharmacy,
+# with the same M/M/c nodes, FIFO queues and warmup rules as the SimPy model.
+# Uses Numba when it is installed; sim_engine falls back to the SimPy model otherwise.
+import math
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:  # optional dependency
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        # no-op stand-in so this module still imports (and runs, slowly) without Numba
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda f: f
+
+# node indices used by the arrays below (order of the 'nodes' axis)
+REGISTRATION, DOCTOR, LAB, PHARMACY = 0, 1, 2, 3
+NODE_NAMES = ('registration', 'doctor', 'lab', 'pharmacy')
+# timestamp indices (second axis of `times`)
+T_ARRIVAL, T_START, T_END = 0, 1, 2
+# rows of `areas`, `sums` and `counts`
+A_QUEUE, A_BUSY, A_SYSTEM = 0, 1, 2
+S_WAIT, S_SERVICE, S_RESPONSE = 0, 1, 2
+C_COMPLETED, C_WAIT, C_SERVICE, C_RESPONSE = 0, 1, 2, 3
+
+@njit(cache=True)
+def _update_areas(k, t, last_t, busy, q_head, q_tail, areas):
+    # integrate node k's state since its last event, as QueueNode._update_areas does
+    delta = t - last_t[k]
+    if delta < 0.0:
+        delta = 0.0
+    q_len = q_tail[k] - q_head[k]
+    areas[A_QUEUE, k] += q_len * delta
+    areas[A_BUSY, k] += busy[k] * delta
+    areas[A_SYSTEM, k] += (q_len + busy[k]) * delta
+    last_t[k] = t
+
+@njit(cache=True)
+def _start_service(k, p, t, slot, mus, times, counted, sums, counts, timer_t, timer_p):
+    # patient p starts service at node k on server timer slot `slot`
+    times[k, T_START, p] = t
+    if counted[p]:
+        sums[S_WAIT, k] += t - times[k, T_ARRIVAL, p]
+        counts[C_WAIT, k] += 1
+    service_time = np.random.exponential(1.0 / mus[k]) if mus[k] > 0 else 0.0
+    timer_t[slot] = t + service_time
+    timer_p[slot] = p
+
+@njit(cache=True)
+def simulate(lam, mus, servers, p_lab, warmup, run_time, seed):
+    """
+    Run one replication until warmup + run_time.
+
+    lam: external arrival rate; mus, servers: per-node arrays in NODE_NAMES order.
+    Returns (n, arrival_times, times, areas, sums, counts):
+      arrival_times[n]      patient arrival times (patient i has id i + 1)
+      times[4, 3, n]        per node arrival / service start / service end, NaN if not reached
+      areas[3, 4]           queue / busy / system time integrals up to warmup + run_time
+      sums[3, 4]            wait / service / response sums over post-warmup patients
+      counts[4, 4]          completed jobs and wait / service / response counts
+    """
+    np.random.seed(seed)
+    t_end = warmup + run_time
+    # patient arrays sized well above the expected lam * t_end arrivals; arrivals stop if it fills
+    max_n = int(math.ceil(lam * t_end * 1.3)) + 16 if lam > 0 else 1
+    arrival_times = np.empty(max_n, dtype=np.float64)
+    counted = np.zeros(max_n, dtype=np.bool_)
+    times = np.full((4, 3, max_n), np.nan)
+    # per-node FIFO of waiting patients; each patient joins a node's queue at most once
+    queue = np.empty((4, max_n), dtype=np.int64)
+    q_head = np.zeros(4, dtype=np.int64)
+    q_tail = np.zeros(4, dtype=np.int64)
+    busy = np.zeros(4, dtype=np.int64)
+    last_t = np.zeros(4, dtype=np.float64)
+    areas = np.zeros((3, 4), dtype=np.float64)
+    sums = np.zeros((3, 4), dtype=np.float64)
+    counts = np.zeros((4, 4), dtype=np.int64)
+
+    # future event set: one timer per possible event, the next one is the argmin.
+    # slot 0 is the next external arrival; node k owns slots first[k] .. first[k+1]-1,
+    # one per server, holding that server's service end time (inf while idle).
+    n_slots = 1 + int(servers.sum())
+    timer_t = np.full(n_slots, np.inf)
+    timer_p = np.zeros(n_slots, dtype=np.int64)   # patient in service on each slot
+    slot_node = np.full(n_slots, -1, dtype=np.int64)
+    first = np.zeros(5, dtype=np.int64)
+    first[0] = 1
+    for k in range(4):
+        first[k + 1] = first[k] + servers[k]
+        slot_node[first[k]:first[k + 1]] = k
+    if lam > 0:
+        timer_t[0] = np.random.exponential(1.0 / lam)
+
+    n = 0
+    while True:
+        i = np.argmin(timer_t)
+        t = timer_t[i]
+        if t >= t_end:
+            break
+        if i == 0:
+            # external arrival: new patient goes to registration
+            p = n
+            n += 1
+            arrival_times[p] = t
+            counted[p] = t >= warmup
+            timer_t[0] = t + np.random.exponential(1.0 / lam) if n < max_n else np.inf
+            nxt = REGISTRATION
+        else:
+            # service end at node k on slot i
+            k = slot_node[i]
+            p = timer_p[i]
+            times[k, T_END, p] = t
+            if counted[p]:
+                sums[S_SERVICE, k] += t - times[k, T_START, p]
+                sums[S_RESPONSE, k] += t - times[k, T_ARRIVAL, p]
+                counts[C_SERVICE, k] += 1
+                counts[C_RESPONSE, k] += 1
+            counts[C_COMPLETED, k] += 1
+            _update_areas(k, t, last_t, busy, q_head, q_tail, areas)
+            if q_tail[k] > q_head[k]:
+                # hand the server (same slot) straight to the head of the queue
+                waiting = queue[k, q_head[k]]
+                q_head[k] += 1
+                _start_service(k, waiting, t, i, mus, times, counted, sums, counts, timer_t, timer_p)
+            else:
+                busy[k] -= 1
+                timer_t[i] = np.inf
+            # routing
+            if k == REGISTRATION:
+                nxt = DOCTOR
+            elif k == DOCTOR:
+                nxt = LAB if np.random.random() < p_lab else PHARMACY
+            elif k == LAB:
+                nxt = PHARMACY
+            else:
+                nxt = -1  # leaves the system after pharmacy
+
+        if nxt >= 0:
+            # patient p arrives at node nxt
+            times[nxt, T_ARRIVAL, p] = t
+            _update_areas(nxt, t, last_t, busy, q_head, q_tail, areas)
+            if busy[nxt] < servers[nxt]:
+                busy[nxt] += 1
+                # any idle server slot of this node
+                slot = first[nxt]
+                while timer_t[slot] != np.inf:
+                    slot += 1
+                _start_service(nxt, p, t, slot, mus, times, counted, sums, counts, timer_t, timer_p)
+            else:
+                queue[nxt, q_tail[nxt]] = p
+                q_tail[nxt] += 1
+
+    # close the area integrals at the end of the run
+    for k in range(4):
+        _update_areas(k, t_end, last_t, busy, q_head, q_tail, areas)
+
+    return n, arrival_times[:n].copy(), times[:, :, :n].copy(), areas, sums, counts
+
+def warmup_jit():
+    """
+    Compile simulate() once on a tiny run so later calls (and worker processes, via
+    the on-disk cache) do not pay the JIT cost. No-op without Numba.
+    """
+    if HAVE_NUMBA:
+        simulate(1.0, np.ones(4), np.ones(4, dtype=np.int64), 0.5, 0.0, 1.0, 0)
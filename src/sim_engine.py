@@ -1,49 +1,49 @@
 # src/sim_engine.py
 import simpy
-import random
 import argparse
 import os
 import csv
+import math
+import numpy as np
+from numpy.random import SeedSequence, default_rng
+from concurrent.futures import ProcessPoolExecutor
 from config import config
-from queue_node import QueueNode
+from queue_node import QueueNode, NodeStats
+from sim_core import HAVE_NUMBA, NODE_NAMES, simulate
 from arrival import arrival_generator
-from router import route_after_doctor
-from metrics import Metrics
-
-def run_once(run_time, warmup_time, seed, out_dir, workload_name="default"):
-    random.seed(seed)
+from metrics import Metrics, ArrayMetrics, PER_NODE_HEADER, CSV_BUFFERING
+
+def _resolve_model(arrival_rate, node_params, p_lab):
+    # fill unset model parameters from config
+    if arrival_rate is None:
+        arrival_rate = config['arrival_rate']
+    if node_params is None:
+        node_params = config['nodes']
+    if p_lab is None:
+        p_lab = config['routing']['p_lab']
+    return arrival_rate, node_params, p_lab
+
+def run_once(run_time, warmup_time, seed, out_dir, workload_name="default", arrival_rate=None,
+             node_params=None, p_lab=None):
+    """
+    seed: int or numpy SeedSequence. One Generator built from it drives arrivals,
+    service times and routing for this replication.
+    arrival_rate, node_params (name -> {'service_rate', 'servers'}) and p_lab default to config.
+    """
+    arrival_rate, node_params, p_lab = _resolve_model(arrival_rate, node_params, p_lab)
+    rng = default_rng(seed)
     env = simpy.Environment()
     # create nodes
     nodes = {}
-    for name, params in config['nodes'].items():
-        nodes[name] = QueueNode(env, name, params['service_rate'], params['servers'])
+    for name, params in node_params.items():
+        nodes[name] = QueueNode(env, name, params['service_rate'], params['servers'], warmup_time, rng=rng)
 
     # metrics instance: effective run_time is run_time (we will run env until warmup+run_time)
     metrics = Metrics(nodes, warmup_time, run_time, output_dir=out_dir)
 
-    # spawn arrival process (lambda is config['arrival_rate'])
-    env.process(arrival_generator(env, config['arrival_rate'], nodes['registration'], metrics))
-
-    # We need to ensure that after finishing registration, patient proceeds to doctor,
-    # and after doctor, router drives them to lab and pharmacy.
-    # Easiest approach: wrap registration.serve to chain processes by modifying QueueNode.serve usage:
-    # For simplicity: we will create a small helper that periodically checks for patients who have finished registration
-    # but this is complex. Instead, we will embed chaining by making registration.serve call doctor and router
-    # To avoid modifying QueueNode class, we will monkey-patch registration.serve with a wrapper function.
-
-    # Save original serve
-    original_reg_serve = nodes['registration'].serve
-
-    def registration_serve_wrapper(patient):
-        # call original registration serve; after it completes, chain doctor and routing
-        yield from original_reg_serve(patient)
-        # immediately go to doctor
-        yield from nodes['doctor'].serve(patient)
-        # after doctor, route to lab/pharmacy
-        yield from route_after_doctor(env, patient, nodes['lab'], nodes['pharmacy'], config['routing']['p_lab'])
-
-    # monkey-patch
-    nodes['registration'].serve = registration_serve_wrapper
+    # spawn arrival process (lambda defaults to config['arrival_rate']);
+    # each patient then runs router.patient_flow through all nodes
+    env.process(arrival_generator(env, arrival_rate, nodes, p_lab, metrics, rng=rng))
 
     sim_end_time = warmup_time + run_time
     env.run(until=sim_end_time)
@@ -53,7 +53,79 @@ def run_once(run_time, warmup_time, seed, out_dir, workload_name="default"):
 
     return metrics
 
-def run_experiment(run_time, warmup_time, replications, base_seed, output_dir, workload_name="default"):
+def run_once_core(run_time, warmup_time, seed, out_dir, workload_name="default", arrival_rate=None,
+                  node_params=None, p_lab=None):
+    """
+    Same model as run_once, executed by the compiled event loop in sim_core.
+    Returns an ArrayMetrics with the same interface as the Metrics from run_once.
+    """
+    arrival_rate, node_params, p_lab = _resolve_model(arrival_rate, node_params, p_lab)
+    if isinstance(seed, SeedSequence):
+        # the core seeds Numba's own generator, which takes a 32-bit integer
+        seed = seed.generate_state(1)[0]
+    params = [node_params[name] for name in NODE_NAMES]
+    mus = np.array([p['service_rate'] for p in params], dtype=np.float64)
+    servers = np.array([p['servers'] for p in params], dtype=np.int64)
+    n, arrival_times, times, areas, sums, counts = simulate(
+        float(arrival_rate), mus, servers, float(p_lab),
+        float(warmup_time), float(run_time), int(seed))
+
+    nodes = {}
+    for k, name in enumerate(NODE_NAMES):
+        node = NodeStats(name, mus[k], servers[k])
+        node.queue_area, node.busy_area, node.system_area = (float(v) for v in areas[:, k])
+        node.wait_sum, node.service_sum, node.response_sum = (float(v) for v in sums[:, k])
+        node.completed_jobs, node.wait_count, node.service_count, node.response_count = (int(v) for v in counts[:, k])
+        nodes[name] = node
+    return ArrayMetrics(nodes, warmup_time, run_time, arrival_times, times, output_dir=out_dir)
+
+def _runner(engine):
+    # 'auto' uses the compiled core when Numba is installed, otherwise the SimPy model
+    if engine == 'simpy':
+        return run_once
+    if engine == 'core':
+        return run_once_core
+    if engine == 'auto':
+        return run_once_core if HAVE_NUMBA else run_once
+    raise ValueError(f"unknown engine {engine!r}; expected 'auto', 'simpy' or 'core'")
+
+def run_replication(run_time, warmup_time, rep, seed, output_dir, workload_name="default", arrival_rate=None,
+                    engine='simpy', node_params=None, p_lab=None):
+    """
+    Run one replication and reduce it to a small picklable result, so it can be
+    executed in a worker process: per-node CSV rows, node stats and overall stats.
+    """
+    metrics = _runner(engine)(run_time, warmup_time, seed, output_dir, workload_name, arrival_rate,
+                              node_params, p_lab)
+    # node integrals were already closed at warmup_time + run_time by the runner
+
+    # write per-patient CSV
+    # per_patient_file = os.path.join(output_dir, "per_patient", f"{workload_name}_rep{rep}_seed{seed}.csv")
+    # metrics.write_per_patient_csv(per_patient_file, workload_name, rep, seed)
+
+    return {
+        'rep': rep,
+        'seed': seed,
+        'node_rows': list(metrics.per_node_rows(workload_name, rep, seed)),
+        'node_stats': metrics.compute_node_metrics(),
+        'overall': metrics.compute_overall_metrics()
+    }
+
+def run_experiment(run_time, warmup_time, replications, base_seed, output_dir, workload_name="default",
+                   max_workers=None, arrival_rate=None, engine=None):
+    """
+    Run independent replications in a process pool (max_workers=None uses all cores,
+    max_workers=1 runs them serially in this process) and write per-node and summary CSVs.
+    arrival_rate and engine ('auto', 'simpy' or 'core') default to the values in config; node
+    parameters and p_lab are read from config here and passed to every replication.
+    """
+    # resolve once here so worker processes see the same values even if they re-import config
+    # (spawn/forkserver workers would otherwise miss in-process changes to config)
+    arrival_rate, node_params, p_lab = _resolve_model(arrival_rate, None, None)
+    node_params = {name: dict(params) for name, params in node_params.items()}
+    if engine is None:
+        engine = config['engine']
+    _runner(engine)  # fail on a bad engine name before any worker starts
     os.makedirs(output_dir, exist_ok=True)
     # per_patient_dir = os.path.join(output_dir, "per_patient")
     per_node_dir = os.path.join(output_dir, "per_node_rep")
@@ -65,26 +137,32 @@ def run_experiment(run_time, warmup_time, replications, base_seed, output_dir, w
     all_node_stats = []  # collect per-rep node stats for summary
     all_overall_stats = []  # collect per-rep overall stats (E[w], E[R], num_patients)
 
-    for rep in range(replications):
-        seed = base_seed + rep
-        metrics = run_once(run_time, warmup_time, seed, output_dir, workload_name)
-        sim_end = warmup_time + run_time
-        # finalize nodes to account area up to sim_end
-        metrics.finalize_nodes(sim_end)
-
-        # write per-patient CSV
-        # per_patient_file = os.path.join(per_patient_dir, f"{workload_name}_rep{rep}_seed{seed}.csv")
-        # metrics.write_per_patient_csv(per_patient_file, workload_name, rep, seed)
-
-        # write per-node CSV
-        per_node_file = os.path.join(per_node_dir, f"{workload_name}_rep{rep}_seed{seed}.csv")
-        metrics.write_per_node_csv(per_node_file, workload_name, rep, seed)
-
-        # compute stats
-        node_stats = metrics.compute_node_metrics()
-        overall = metrics.compute_overall_metrics()
-        all_node_stats.append((rep, seed, node_stats))
-        all_overall_stats.append((rep, seed, overall))
+    # all replications' per-node rows go to one long-format CSV per workload
+    per_node_file = os.path.join(per_node_dir, f"{workload_name}_all.csv")
+    with open(per_node_file, 'w', newline='', buffering=CSV_BUFFERING) as per_node_f:
+        per_node_writer = csv.writer(per_node_f)
+        per_node_writer.writerow(PER_NODE_HEADER)
+
+        # independent, reproducible per-replication streams spawned from base_seed, each
+        # reduced to one 32-bit seed (what the core takes); it is written to the 'seed'
+        # column, and run_once / run_once_core with it reproduce that replication
+        seeds = [int(child.generate_state(1)[0]) for child in SeedSequence(base_seed).spawn(replications)]
+        args = [(run_time, warmup_time, rep, seeds[rep], output_dir, workload_name, arrival_rate, engine,
+                 node_params, p_lab)
+                for rep in range(replications)]
+        if max_workers == 1:
+            results = [run_replication(*a) for a in args]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as ex:
+                futures = [ex.submit(run_replication, *a) for a in args]
+                results = [fut.result() for fut in futures]
+
+        for res in results:
+            rep, seed = res['rep'], res['seed']
+            # append per-node rows
+            per_node_writer.writerows(res['node_rows'])
+            all_node_stats.append((rep, seed, res['node_stats']))
+            all_overall_stats.append((rep, seed, res['overall']))
 
     # produce a simple summary CSV for overall metrics
     summary_file = os.path.join(summary_dir, f"{workload_name}_summary.csv")
@@ -97,14 +175,13 @@ def run_experiment(run_time, warmup_time, replications, base_seed, output_dir, w
     Ew_list = [entry[2]['E[w]'] for entry in all_overall_stats]
     Er_list = [entry[2]['E[R]'] for entry in all_overall_stats]
 
-    import statistics, math
-
     def mean_std_ci(xlist):
         if not xlist:
             return (0.0, 0.0, 0.0, 0.0)
-        m = statistics.mean(xlist)
-        s = statistics.stdev(xlist) if len(xlist) > 1 else 0.0
-        n = len(xlist)
+        arr = np.asarray(xlist, dtype=float)
+        m = float(arr.mean())
+        s = float(arr.std(ddof=1)) if arr.size > 1 else 0.0
+        n = arr.size
         # 95% t-interval approx using t_{0.975, n-1} ~ 2. block if n small
         t = 2.0 if n > 1 else 0.0
         ci = t * s / math.sqrt(n) if n > 1 else 0.0
@@ -124,18 +201,42 @@ def run_experiment(run_time, warmup_time, replications, base_seed, output_dir, w
         'Er_list': Er_list,
         'summary_file': summary_file,
         # 'per_patient_dir': per_patient_dir,
-        'per_node_dir': per_node_dir
+        'per_node_dir': per_node_dir,
+        'per_node_file': per_node_file
     }
 
+def _seed_arg(value):
+    # SeedSequence only accepts non-negative integers
+    try:
+        seed = int(value)
+    except ValueError:
+        seed = -1
+    if seed < 0:
+        raise argparse.ArgumentTypeError(f"seed must be a non-negative integer, got {value!r}")
+    return seed
+
+def _workers_arg(value):
+    # ProcessPoolExecutor needs at least one worker
+    try:
+        workers = int(value)
+    except ValueError:
+        workers = 0
+    if workers < 1:
+        raise argparse.ArgumentTypeError(f"workers must be a positive integer, got {value!r}")
+    return workers
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--run_time", type=float, default=config['default_run_time'])
     parser.add_argument("--warmup_time", type=float, default=config['default_warmup_time'])
     parser.add_argument("--replications", type=int, default=config['default_replications'])
-    parser.add_argument("--seed", type=int, default=12345)
+    parser.add_argument("--seed", type=_seed_arg, default=12345)
     parser.add_argument("--output", type=str, default="outputs/results_csv")
     parser.add_argument("--workload", type=str, default="default")
+    parser.add_argument("--workers", type=_workers_arg, default=None)
+    parser.add_argument("--engine", choices=['auto', 'simpy', 'core'], default=config['engine'])
     args = parser.parse_args()
 
-    res = run_experiment(args.run_time, args.warmup_time, args.replications, args.seed, args.output, args.workload)
+    res = run_experiment(args.run_time, args.warmup_time, args.replications, args.seed, args.output, args.workload,
+                         max_workers=args.workers, engine=args.engine)
     print("Experiment finished. Summary:", res['summary_file'])